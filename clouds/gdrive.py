@@ -6,6 +6,7 @@ import fs.path
 from fs.googledrivefs import GoogleDriveFS
 from fs import open_fs
 import fs.mirror
+from fs.subfs import ClosingSubFS
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -129,14 +130,21 @@ class GoogleDriveFS_2(GoogleDriveFS):
     writetext = decorate_for_permission_error(_base.writetext)
 
 
-def make_google_drive_fs(drive_path=None):
-    credentials = google_drive_credentials()
+def make_google_drive_fs(drive_path=None, credentials=None, create=True):
+    """
+    :param drive_path: open this dir
+    :param credentials: pass existing credentials to avoid reading (or even refreshing) the token again
+    :param create: pass False if drive_path is known to exist
+    """
+    credentials = credentials or google_drive_credentials()
     assert credentials
     drive_fs = GoogleDriveFS_2(credentials=credentials)
 
     if drive_path:
-        drive_fs.makedirs(drive_path, recreate=True)
-        drive_fs = drive_fs.opendir(drive_path)
+        if create:
+            drive_fs.makedirs(drive_path, recreate=True)
+        # closing the dir should close the Drive fs, too
+        drive_fs = drive_fs.opendir(drive_path, factory=ClosingSubFS)
 
     return drive_fs
 
@@ -25,8 +25,12 @@ Normal everyday workflow:
 """
 
 from collections import ChainMap  # @see №5 in https://favtutor.com/blogs/merge-dictionaries-python
+from functools import partial
+import hashlib
 import os
 from pathlib import Path
+from timeit import default_timer as timer
+from typing import Callable
 
 from adict import adict
 from fs import open_fs
@@ -37,8 +41,12 @@ import fs.mirror
 from fs.walk import Walker
 import yaml
 
-from clouds.gdrive import make_google_drive_fs
+from clouds.gdrive import make_google_drive_fs, google_drive_credentials
 from util.enc_zip import compress_fs, uncompress, compress_files
+from util.relocate import ListingCacheFS, plan_relocations, apply_relocations
+from util.auto_level import TransferStats, sample_fs_contents, choose_compression_level
+from util.cache import FileCache, link_or_copy
+from util.parts import split_file, join_parts, is_part_valid, part_path, remove_unlisted_parts, copy_files_parallel
 from helpers import duration_report
 
 
@@ -57,6 +65,10 @@ class Folder:
         # abstract method.
         raise NotImplementedError()
 
+    def fs_factory(self) -> Callable[[], FS]:
+        """Get a function making new fs instances, e.g. one per thread"""
+        return self.get_fs
+
 
 class LocalFolder(Folder):
     def __init__(self, root_path: str | Path):
@@ -81,6 +93,12 @@ class GoogleDriveFolder(RemoteFolder):
     def get_fs(self):
         return make_google_drive_fs(self.drive_path)
 
+    def fs_factory(self):
+        # obtain credentials (and create the dir) once, not in every thread
+        credentials = google_drive_credentials()
+        self.fs  # make sure the dir exists
+        return partial(make_google_drive_fs, self.drive_path, credentials, create=False)
+
 
 class SharedFolderConfig(adict):
     # mandatory:
@@ -90,6 +108,10 @@ class SharedFolderConfig(adict):
     type: str
     remote_kind: str
     staging_path: str
+    compression_level: int | str
+    part_size_mb: int
+    transfer_workers: int
+    cache_size_mb: int
     # future options:
     # include_patterns: list
     # ignore_patterns: list
@@ -98,6 +120,10 @@ class SharedFolderConfig(adict):
     _init_defaults = dict(
         type='as-is',
         remote_kind='google-drive',
+        compression_level=5,
+        part_size_mb=0,  # do not split archives
+        transfer_workers=4,
+        cache_size_mb=1024,
     )
 
     # @see https://docs.pyfilesystem.org/en/latest/reference/walk.html
@@ -115,6 +141,10 @@ class SharedFolderConfig(adict):
         assert self.local_path  # should point to any existing location on local drive
         assert self.type
         assert self.type in ('as-is', 'archive')
+        assert self.compression_level == 'auto' or self.compression_level in range(0, 10), self.compression_level
+        assert self.part_size_mb >= 0
+        assert self.transfer_workers >= 1
+        assert self.cache_size_mb >= 0
         ### self.remote_kind = 'google-drive'
         # ignore_patterns: list
         # follow_gitignore: bool
@@ -176,6 +206,9 @@ class SharedFolderManager:
     def mirror_fs_with_filter(self, src_fs: FS, dst_fs: FS, keep_dst_contents=True):
         if not self.config.filters:
             # mirror_fs_contents(src_fs, dst_fs)
+            # walk each fs once for both relocating and mirroring
+            src_fs, dst_fs = ListingCacheFS(src_fs), ListingCacheFS(dst_fs)
+            self.relocate_moved_files(src_fs, dst_fs)
             print(end=' mirroring fs contents...')
             fs.mirror.mirror(src_fs, dst_fs, preserve_time=True)
 
@@ -186,9 +219,19 @@ class SharedFolderManager:
             if keep_dst_contents:
                 fs.copy.copy_fs_if(src_fs, dst_fs, 'newer', preserve_time=True, walker=walker)
             else:
+                src_fs, dst_fs = ListingCacheFS(src_fs), ListingCacheFS(dst_fs)
+                self.relocate_moved_files(src_fs, dst_fs, walker)
                 fs.mirror.mirror(src_fs, dst_fs, preserve_time=True, walker=walker)
         print(' done.')
 
+    def relocate_moved_files(self, src_fs: FS, dst_fs: FS, walker: Walker = None):
+        """Before mirroring: move/copy files within dst_fs instead of transferring the same content again"""
+        relocations = plan_relocations(src_fs, dst_fs, walker)
+        if relocations:
+            print(end=f' relocating {len(relocations)} file(s)...')
+            count_ok = apply_relocations(dst_fs, relocations)
+            print(end=f' {count_ok} relocated.')
+
     def phase_name(self, name: str):
         return "{}! ({})".format(name, self.config.name)
 
@@ -222,10 +265,61 @@ class SharedFolderManager:
 class ArchivingSharedFolderManager(SharedFolderManager):
     archive_filename = '/folder.zip'  # hardcoded so far
     hashed_filename_template = '%s.dat'
+    transfer_stats_filename = 'transfer_stats.yml'
+    manifest_filename_template = '%s.parts.yml'
+    parts_dir = '/parts'
+    cache_dirname = '.archive_cache'
+    plain_compression_level = 0
+    fallback_compression_level = 5  # for `auto` mode until upload speed is measured
 
     def __init__(self, config: adict = None):
         super().__init__(config)
         self.temp = LocalFolder(fs.path.join(config.temp_root_path, config.name))
+        # shared by all folders: bandwidth is a property of the machine's connection
+        self.transfer_stats = TransferStats(Path(config.temp_root_path, self.transfer_stats_filename))
+        # each folder has its own cache, with its own size limit
+        self.cache = FileCache(Path(config.temp_root_path, self.cache_dirname, config.name),
+                               config.cache_size_mb * 2**20)
+
+    def cache_key(self, filepath: str) -> str:
+        # archives are encrypted, so a version cached with another password (e.g. salt changed) is no good
+        password_digest = hashlib.sha256(self.config.password_for_archive().encode()).hexdigest()[:16]
+        return password_digest + '/' + fs.path.basename(filepath)
+
+    def put_to_cache(self, filepath: str):
+        """Keep a version archived in temp for future use"""
+        self.cache.put(self.cache_key(filepath), self.temp.fs.getsyspath(filepath))
+
+    def restore_from_cache(self, filepath: str) -> bool:
+        """Bring a cached version to temp (replacing any other version), if the version is cached"""
+        cached_path = self.cache.get(self.cache_key(filepath))
+        if not cached_path:
+            return False
+
+        # clear old versions first
+        for path in self.temp.fs.walk.files(filter=[self.hashed_file_pattern()]):
+            self.temp.fs.remove(path)
+        self.remove_parts(self.temp.fs)
+
+        link_or_copy(cached_path, self.temp.fs.getsyspath(filepath))
+        return True
+
+    def compression_level(self) -> int:
+        """Get compression level for encrypted archive: configured one or chosen automatically"""
+        if self.config.compression_level != 'auto':
+            return self.config.compression_level
+
+        default_level = self.fallback_compression_level
+        bandwidth = self.transfer_stats.bandwidth('upload')
+        if not bandwidth:
+            print(end=f'no upload speed measured yet, level {default_level} ... ')
+            return default_level
+
+        sample, total_size = sample_fs_contents(self.staging.fs)
+        choice = choose_compression_level(sample, total_size, bandwidth)
+        print(end=f'auto level {choice.level} (upload {bandwidth / 2**20:.2f} MiB/s,'
+                  f' expected {choice.expected_seconds:.1f} s) ... ')
+        return choice.level
 
     def compress_with_hash(self):
         """As part of push!: archive staging --> temp"""
@@ -236,9 +330,10 @@ class ArchivingSharedFolderManager(SharedFolderManager):
         # # clear dir first ??
         # dst_fs.removetree('/')
 
-        # 1. (re-)create archive without encryption
+        # 1. (re-)create archive without encryption.
+        # Files are just stored, so the hash (i.e. version) depends on content only, not on compression level
         plain_archive_filepath = dst_fs.getsyspath(self.archive_filename)
-        compress_fs(src_fs, plain_archive_filepath)
+        compress_fs(src_fs, plain_archive_filepath, compression_level=self.plain_compression_level)
 
         # calc archive hash
         file_hash = dst_fs.hash(self.archive_filename, hash_alg_name)
@@ -251,17 +346,23 @@ class ArchivingSharedFolderManager(SharedFolderManager):
             print('this version is already archived.')
             return new_filename
 
+        if self.restore_from_cache(new_filename):
+            # this version has been here before, no need to encrypt it again.
+            print('this version is restored from local cache.')
+            return new_filename
+
         # clear old versions first
         file_pattern = self.hashed_file_pattern()
         for path in dst_fs.walk.files(filter=[file_pattern]):
             dst_fs.remove(path)
 
         # 2. compress archive again, with encryption
+        compression_level = self.compression_level()
         compress_files([plain_archive_filepath],
                        dst_fs.getsyspath(new_filename),
                        base_path=dst_fs.getsyspath('/'),
                        password=self.config.password_for_archive(),
-                       compression_level=1)
+                       compression_level=compression_level)
 
         print('done.')
         return new_filename
@@ -280,17 +381,22 @@ class ArchivingSharedFolderManager(SharedFolderManager):
             filepath = self.find_hashed_file(src_fs)
 
         archive_syspath = src_fs.getsyspath(filepath)
+        version = fs.path.splitext(fs.path.basename(filepath))[0]
 
-        # 1. extract encrypted archive
-        uncompress(
-            archive_syspath,
-            src_fs.getsyspath('/'),
-            self.config.password_for_archive(),
-        )
+        # the version is the hash of plain archive, so it may be left from previous push/fetch
+        if src_fs.exists(self.archive_filename) and src_fs.hash(self.archive_filename, 'md5') == version:
+            print(end=' bundle is opened already... ')
+        else:
+            # 1. extract encrypted archive
+            uncompress(
+                archive_syspath,
+                src_fs.getsyspath('/'),
+                self.config.password_for_archive(),
+            )
 
-        assert src_fs.exists(self.archive_filename)
+            assert src_fs.exists(self.archive_filename)
 
-        print(end=' bundle opened... ')
+            print(end=' bundle opened... ')
 
         # 2. extract plain archive containing user files
         uncompress(
@@ -303,6 +409,108 @@ class ArchivingSharedFolderManager(SharedFolderManager):
         # src_fs.removetree('/'))
         print(' content is replaced. ')
 
+    def manifest_file_pattern(self):
+        return self.manifest_filename_template % '*'
+
+    def find_manifest_file(self, src_fs: FS) -> str | None:
+        # normally at most one file present, but an interrupted push may leave the old one, too
+        files = {path: info.raw['details'].get('modified') or 0
+                 for path, info in src_fs.walk.info(filter=[self.manifest_file_pattern()], max_depth=1,
+                                                    namespaces=['details'])
+                 if info.is_file}
+        # the newest one
+        return max(files, key=files.get) if files else None
+
+    def remove_parts(self, dst_fs: FS, manifest: dict = None, keep_manifest: str = None):
+        """Clear old versions of split archive: manifests except keep_manifest, and parts not listed in manifest"""
+        for path in dst_fs.walk.files(filter=[self.manifest_file_pattern()], max_depth=1):
+            if path != keep_manifest:
+                dst_fs.remove(path)
+        if manifest:
+            remove_unlisted_parts(dst_fs, self.parts_dir, manifest)
+        elif dst_fs.exists(self.parts_dir):
+            dst_fs.removetree(self.parts_dir)
+
+    def push_parts(self, filename: str):
+        """As part of push!: split archive into parts and upload the missing ones in parallel, temp --> remote"""
+        src_fs, dst_fs = self.temp.fs, self.remote.fs
+        manifest_filename = fs.path.abspath(self.manifest_filename_template % fs.path.splitext(filename)[0])
+
+        if dst_fs.exists(manifest_filename):
+            # the manifest is uploaded last, so all parts are there
+            # (but old versions may remain if previous push has been interrupted)
+            manifest = yaml.safe_load(dst_fs.readtext(manifest_filename))
+            self.remove_old_remote_versions(manifest, manifest_filename)
+            print(' already up-to-date.')
+            return
+
+        print(end=' splitting archive...')
+        manifest = split_file(src_fs, filename, self.parts_dir, self.config.part_size_mb * 2**20)
+        # parts of other versions may be left by interrupted push
+        self.remove_parts(src_fs, manifest)
+
+        dst_fs.makedirs(self.parts_dir, recreate=True)
+        present = set(dst_fs.listdir(self.parts_dir))
+        parts = [part for part in manifest['parts']
+                 if part['name'] not in present or not is_part_valid(dst_fs, self.parts_dir, part)]
+
+        print(end=f' uploading {len(parts)} of {len(manifest["parts"])} part(s)...')
+        start_time = timer()
+        copy_files_parallel(self.temp.fs_factory(), self.remote.fs_factory(),
+                            [part_path(self.parts_dir, part) for part in parts],
+                            self.config.transfer_workers)
+        self.transfer_stats.add('upload', sum(part['size'] for part in parts), timer() - start_time)
+        dst_fs.writetext(manifest_filename, yaml.safe_dump(manifest))
+
+        self.remove_old_remote_versions(manifest, manifest_filename)
+        # parts are of no use locally any more: the archive is kept entirely
+        self.remove_parts(src_fs)
+        print(' done.')
+
+    def remove_old_remote_versions(self, manifest: dict, manifest_filename: str):
+        dst_fs = self.remote.fs
+        for path in dst_fs.walk.files(filter=[self.hashed_file_pattern()]):
+            dst_fs.remove(path)
+        self.remove_parts(dst_fs, manifest, manifest_filename)
+
+    def fetch_parts(self, manifest_filename: str) -> str:
+        """As part of fetch!: download missing parts in parallel and assemble archive, remote --> temp"""
+        src_fs, dst_fs = self.remote.fs, self.temp.fs
+        print(end=' fetching parts...')
+        manifest = yaml.safe_load(src_fs.readtext(manifest_filename))
+        filepath = fs.path.abspath(manifest['archive'])
+
+        if dst_fs.exists(filepath):
+            # no point in downloading the file again
+            print(' already up-to-date.')
+            return filepath
+
+        dst_fs.makedirs(self.parts_dir, recreate=True)
+        # valid parts left by interrupted fetch of this version are kept
+        self.remove_parts(dst_fs, manifest)
+        parts = [part for part in manifest['parts'] if not is_part_valid(dst_fs, self.parts_dir, part)]
+
+        print(end=f' downloading {len(parts)} of {len(manifest["parts"])} part(s)...')
+        start_time = timer()
+        copy_files_parallel(self.remote.fs_factory(), self.temp.fs_factory(),
+                            [part_path(self.parts_dir, part) for part in parts],
+                            self.config.transfer_workers)
+        self.transfer_stats.add('download', sum(part['size'] for part in parts), timer() - start_time)
+
+        for part in parts:
+            if not is_part_valid(dst_fs, self.parts_dir, part):
+                dst_fs.remove(part_path(self.parts_dir, part))
+                raise ValueError(f'Part `{part["name"]}` is damaged while downloading, please retry.')
+
+        # clear old versions, then assemble the archive
+        for path in dst_fs.walk.files(filter=[self.hashed_file_pattern()]):
+            dst_fs.remove(path)
+        print(end=' joining...')
+        join_parts(dst_fs, manifest, self.parts_dir, filepath)
+        self.remove_parts(dst_fs)
+        print(' done.')
+        return filepath
+
     def find_hashed_file(self, src_fs: FS):
         # assume that exactly one file present
         file_pattern = self.hashed_file_pattern()
@@ -311,7 +519,7 @@ class ArchivingSharedFolderManager(SharedFolderManager):
         assert len(files) == 1, ('Only one file expected, found:', files)
         return files[0]
 
-    def mirror_hashed_file(self, src_fs: FS, dst_fs: FS, filepath: str = None) -> str:
+    def mirror_hashed_file(self, src_fs: FS, dst_fs: FS, filepath: str = None, transfer_kind: str = None) -> str:
         print(end=' mirroring file...')
         if not filepath:
             filepath = self.find_hashed_file(src_fs)
@@ -325,21 +533,49 @@ class ArchivingSharedFolderManager(SharedFolderManager):
         file_pattern = self.hashed_file_pattern()
         for path in dst_fs.walk.files(filter=[file_pattern]):
             dst_fs.remove(path)
+        self.remove_parts(dst_fs)
 
         print(end=' transferring...')
+        start_time = timer()
         copy_file(src_fs, filepath, dst_fs, filepath, True)
+        if transfer_kind:
+            # measure bandwidth for future runs
+            self.transfer_stats.add(transfer_kind, src_fs.getsize(filepath), timer() - start_time)
         print(' done.')
         return filepath
 
     def fetch(self):
         with duration_report(self.phase_name('fetch')):
-            filepath = self.mirror_hashed_file(self.remote.fs, self.temp.fs)
+            filepath = self.fetch_archive()
+            self.put_to_cache(filepath)
             self.uncompress_hashed_file(filepath)
 
+    def fetch_archive(self) -> str:
+        """As part of fetch!: get current remote version to temp, from local cache if possible"""
+        # the way of fetching depends on what has been pushed, not on local config
+        manifest_filename = self.find_manifest_file(self.remote.fs)
+        if manifest_filename:
+            version = fs.path.basename(manifest_filename).removesuffix(self.manifest_filename_template % '')
+            filepath = fs.path.abspath(self.hashed_filename_template % version)
+        else:
+            filepath = self.find_hashed_file(self.remote.fs)
+
+        if not self.temp.fs.exists(filepath) and self.restore_from_cache(filepath):
+            print(' version is restored from local cache.')
+            return filepath
+
+        if manifest_filename:
+            return self.fetch_parts(manifest_filename)
+        return self.mirror_hashed_file(self.remote.fs, self.temp.fs, filepath, transfer_kind='download')
+
     def push(self):
         with duration_report(self.phase_name('push')):
             target_filename = self.compress_with_hash()
-            self.mirror_hashed_file(self.temp.fs, self.remote.fs, target_filename)
+            self.put_to_cache(target_filename)
+            if self.config.part_size_mb:
+                self.push_parts(target_filename)
+            else:
+                self.mirror_hashed_file(self.temp.fs, self.remote.fs, target_filename, transfer_kind='upload')
 
 
 def get_shared_folder_manager_by_type(config_type: str) -> type:
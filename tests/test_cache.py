@@ -0,0 +1,54 @@
+import os
+import time
+
+from util.cache import FileCache
+
+
+def make_file(path, size=1000, mtime=None):
+    path.write_bytes(b'x' * size)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def set_last_use(cache: FileCache, key: str, mtime: float):
+    os.utime(cache.root_path / key, (mtime, mtime))
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = FileCache(tmp_path / 'cache', 2500)
+    cache.put('a.dat', make_file(tmp_path / 'a'))
+    cache.put('b.dat', make_file(tmp_path / 'b'))
+    set_last_use(cache, 'a.dat', 1000)
+    set_last_use(cache, 'b.dat', 2000)
+    assert cache.get('a.dat')  # now `b` is the least recently used
+
+    cache.put('c.dat', make_file(tmp_path / 'c'))
+
+    assert sorted(os.listdir(cache.root_path)) == ['a.dat', 'c.dat']
+
+
+def test_old_file_put_is_not_evicted_first(tmp_path):
+    # e.g. a fetched version keeps the mtime of its push
+    cache = FileCache(tmp_path / 'cache', 2500)
+    cache.put('a.dat', make_file(tmp_path / 'a'))
+    cache.put('b.dat', make_file(tmp_path / 'b'))
+    now = time.time()
+    set_last_use(cache, 'a.dat', now - 20)
+    set_last_use(cache, 'b.dat', now - 10)
+
+    day_ago = now - 24 * 3600
+    cache.put('c.dat', make_file(tmp_path / 'c', mtime=day_ago))
+
+    assert cache.get('c.dat')
+    assert sorted(os.listdir(cache.root_path)) == ['b.dat', 'c.dat']
+
+
+def test_disabled_or_too_large(tmp_path):
+    cache = FileCache(tmp_path / 'cache', 0)
+    cache.put('a.dat', make_file(tmp_path / 'a'))
+    assert cache.get('a.dat') is None
+
+    cache = FileCache(tmp_path / 'cache', 500)
+    cache.put('a.dat', make_file(tmp_path / 'a'))
+    assert cache.get('a.dat') is None
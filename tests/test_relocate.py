@@ -0,0 +1,98 @@
+from fs.memoryfs import MemoryFS
+import fs.mirror
+import pytest
+
+from control import SharedFolderConfig, SharedFolderManager
+
+
+class ByteCountingFS(MemoryFS):
+    """Stand-in remote: counts bytes written, except for copies within the fs (server-side on Drive)."""
+
+    def __init__(self):
+        super().__init__()
+        self.written = 0
+        self.listed = 0  # dir listings, i.e. API calls on Drive
+        self._counting = True
+
+    def scandir(self, path, namespaces=None, page=None):
+        self.listed += 1
+        return super().scandir(path, namespaces, page)
+
+    def openbin(self, path, mode='r', buffering=-1, **options):
+        f = super().openbin(path, mode, buffering, **options)
+        if self._counting and ('w' in mode or 'a' in mode or '+' in mode):
+            write = f.write
+
+            def counting_write(data):
+                self.written += len(data)
+                return write(data)
+
+            f.write = counting_write
+        return f
+
+    def copy(self, src_path, dst_path, overwrite=False, preserve_time=False):
+        self._counting = False
+        try:
+            super().copy(src_path, dst_path, overwrite, preserve_time)
+        finally:
+            self._counting = True
+
+
+def make_manager(**filters) -> SharedFolderManager:
+    return SharedFolderManager(SharedFolderConfig(
+        name='test',
+        local_path='/tmp/sharea-test/local',
+        remote_root_path='', remote_sub_path='',
+        staging_root_path='/tmp/sharea-test/staging', staging_sub_path='',
+        **filters,
+    ))
+
+
+def all_files(fs_) -> dict[str, bytes]:
+    return {path: fs_.readbytes(path) for path in fs_.walk.files()}
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'filter': ['*.bin']},  # walker path
+])
+def test_moved_and_copied_files_are_not_transferred(filters):
+    mgr = make_manager(**filters)
+    src_fs, dst_fs = MemoryFS(), ByteCountingFS()
+    src_fs.makedirs('a/b')
+    src_fs.writebytes('a/b/x.bin', b'x' * 1000)
+    src_fs.writebytes('a/y.bin', b'y' * 500)
+    src_fs.writebytes('a/z.bin', b'z' * 700)
+    fs.mirror.mirror(src_fs, dst_fs, preserve_time=True)
+    assert dst_fs.written == 1000 + 500 + 700
+    dst_fs.written = 0
+
+    src_fs.makedirs('c')
+    src_fs.move('a/b/x.bin', 'c/x-moved.bin')  # move
+    src_fs.copy('a/y.bin', 'c/y-copy.bin')  # copy
+    src_fs.move('a/z.bin', 'c/z-moved.bin')
+    src_fs.copy('c/z-moved.bin', 'c/z-dup.bin')  # duplicate of a moved file
+    src_fs.removetree('a/b')
+
+    mgr.mirror_fs_with_filter(src_fs, dst_fs, keep_dst_contents=False)
+
+    assert dst_fs.written == 0
+    assert all_files(dst_fs) == all_files(src_fs)
+
+
+def test_remote_is_listed_once_per_dir():
+    mgr = make_manager()
+    src_fs, dst_fs = MemoryFS(), ByteCountingFS()
+    src_fs.makedirs('a/b')
+    src_fs.writebytes('a/b/x.bin', b'x' * 1000)
+    src_fs.writebytes('a/y.bin', b'y' * 500)
+    fs.mirror.mirror(src_fs, dst_fs, preserve_time=True)
+
+    dst_fs.listed = 0
+    fs.mirror.mirror(src_fs, dst_fs, preserve_time=True)
+    mirror_listings = dst_fs.listed
+
+    dst_fs.listed = 0
+    src_fs.writebytes('a/new.bin', b'n' * 100)
+    mgr.mirror_fs_with_filter(src_fs, dst_fs, keep_dst_contents=False)
+    assert dst_fs.listed == mirror_listings
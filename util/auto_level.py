@@ -0,0 +1,99 @@
+from pathlib import Path
+from statistics import median
+from timeit import default_timer as timer
+from typing import NamedTuple
+import zlib
+
+from fs.base import FS
+import yaml
+
+
+class TransferStats:
+    """
+    Keeps recent transfer throughput measurements (bytes per second) in a yaml file,
+     so they are available to the next run.
+    """
+    max_samples = 10
+    min_size = 64 * 1024  # smaller transfers are dominated by latency, do not measure them
+
+    def __init__(self, store_path: str | Path):
+        self.store_file = Path(store_path)
+        self.samples = {}  # kind ('upload' / 'download') -> list of bytes per second
+        self.load()
+
+    def add(self, kind: str, size: int, seconds: float):
+        if size < self.min_size or seconds <= 0:
+            return
+        self.load()  # the file may be updated by another instance
+        samples = self.samples.setdefault(kind, [])
+        samples.append(size / seconds)
+        del samples[:-self.max_samples]
+        self.save()
+
+    def bandwidth(self, kind: str) -> float | None:
+        """Typical recent throughput in bytes per second, or None if nothing measured yet"""
+        samples = self.samples.get(kind)
+        return median(samples) if samples else None
+
+    def save(self):
+        self.store_file.parent.mkdir(parents=True, exist_ok=True)
+        self.store_file.write_text(yaml.safe_dump(dict(bandwidth=self.samples)))
+
+    def load(self):
+        data = {}
+        if self.store_file.exists():
+            data = yaml.safe_load(self.store_file.read_text()) or {}
+        self.samples = data.get('bandwidth') or {}
+
+
+class LevelChoice(NamedTuple):
+    level: int
+    expected_seconds: float  # compress + transfer
+    bandwidth: float  # bytes per second
+
+
+def sample_fs_contents(fs: FS, sample_size=1024 * 1024, chunk_size=64 * 1024) -> tuple[bytes, int]:
+    """
+    Read a sample of file contents within fs (a chunk from beginning of each file, until sample_size is reached).
+    :return: (sample, total size of all files)
+    """
+    chunks = []
+    sampled = 0
+    total_size = 0
+    for path, info in fs.walk.info(namespaces=['details']):
+        if not info.is_file:
+            continue
+        total_size += info.size
+        if sampled < sample_size and info.size:
+            with fs.openbin(path) as f:
+                chunk = f.read(min(chunk_size, sample_size - sampled))
+            chunks.append(chunk)
+            sampled += len(chunk)
+    return b''.join(chunks), total_size
+
+
+def choose_compression_level(sample: bytes, total_size: int, bandwidth: float,
+                             levels=range(0, 10)) -> LevelChoice:
+    """
+    Pick the deflate level that minimizes expected compress + transfer time for content like the sample.
+    :param sample: a piece of content to measure compression speed & ratio on
+    :param total_size: size of all the content to be compressed
+    :param bandwidth: expected transfer speed, bytes per second
+    :param levels: zlib levels to try, 0 means no compression
+    """
+    if not sample:
+        return LevelChoice(levels[0], total_size / bandwidth, bandwidth)
+
+    choices = {}
+    for level in levels:
+        start_time = timer()
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        compressed_size = len(compressor.compress(sample)) + len(compressor.flush())
+        seconds = max(timer() - start_time, 1e-6)
+
+        compress_speed = len(sample) / seconds
+        ratio = compressed_size / len(sample)
+        expected = total_size / compress_speed + total_size * ratio / bandwidth
+        choices[level] = LevelChoice(level, expected, bandwidth)
+
+    return min(choices.values(), key=lambda choice: choice.expected_seconds)
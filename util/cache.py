@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+import shutil
+
+
+def link_or_copy(src_path: str | Path, dst_path: str | Path):
+    """Make a hard link (no extra disk space used) if possible, or copy the file otherwise"""
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copyfile(src_path, dst_path)
+
+
+class FileCache:
+    """
+    Local cache of files addressed by keys (relative paths), e.g. `<content hash>.dat`.
+    Files are put as hard links when possible, so cached files being used elsewhere do not take space twice
+     (the files are expected to be replaced, not modified in place).
+    Total size is bounded, least recently used files are evicted first
+     (last use is tracked by file mtime, so no index is needed).
+    """
+
+    def __init__(self, root_path: str | Path, max_size: int):
+        self.root_path = Path(root_path)
+        self.max_size = max_size
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: str) -> Path | None:
+        """Get path of the cached file, marking it as recently used, or None if not cached"""
+        path = self.root_path / key
+        if not self.enabled or not path.is_file():
+            return None
+        os.utime(path)
+        return path
+
+    def put(self, key: str, src_path: str | Path):
+        """Link/copy a file to cache (or mark it as recently used if already cached)"""
+        if not self.enabled or self.get(key):
+            return
+        src_path = Path(src_path)
+        if src_path.stat().st_size > self.max_size:
+            return
+
+        path = self.root_path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # copy under another name first, so that interrupted copy is not taken as cached file
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.unlink(missing_ok=True)
+        link_or_copy(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        # a linked (or copied) file keeps mtime of the source, e.g. push time of a fetched version
+        os.utime(path)
+        self.evict()
+
+    def evict(self):
+        files = sorted((p for p in self.root_path.rglob('*') if p.is_file()),
+                       key=lambda p: p.stat().st_mtime)
+        total_size = sum(p.stat().st_size for p in files)
+        for p in files:
+            if total_size <= self.max_size:
+                break
+            total_size -= p.stat().st_size
+            p.unlink()
@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import threading
+from typing import Callable
+
+from fs.base import FS
+from fs.copy import copy_file
+import fs.path
+
+from util.relocate import file_md5
+
+
+def part_path(parts_dir: str, part: dict) -> str:
+    return fs.path.join(parts_dir, part['name'])
+
+
+def split_file(fs_: FS, path: str, parts_dir: str, part_size: int) -> dict:
+    """
+    Split a file into parts of part_size bytes (the last one may be smaller).
+    Each part is named after its md5 hash, so parts already present are not written again.
+    :return: manifest: dict(archive=<file name>, size=<file size>, hash=<md5 of file>, parts=[dict(name=, size=), ...])
+    """
+    fs_.makedirs(parts_dir, recreate=True)
+    file_hash = hashlib.md5()
+    parts = []
+    with fs_.openbin(path) as f:
+        while chunk := f.read(part_size):
+            file_hash.update(chunk)
+            part = dict(name=hashlib.md5(chunk).hexdigest() + '.part', size=len(chunk))
+            if not fs_.exists(part_path(parts_dir, part)):
+                fs_.writebytes(part_path(parts_dir, part), chunk)
+            parts.append(part)
+
+    return dict(
+        archive=fs.path.basename(path),
+        size=sum(part['size'] for part in parts),
+        hash=file_hash.hexdigest(),
+        parts=parts,
+    )
+
+
+def is_part_valid(fs_: FS, parts_dir: str, part: dict) -> bool:
+    """
+    Check that the part is present and not damaged (e.g. by interrupted transfer).
+    The hash is taken from fs info if available (e.g. Google Drive), so remote parts are not downloaded.
+    """
+    path = part_path(parts_dir, part)
+    return (fs_.exists(path)
+            and fs_.getsize(path) == part['size']
+            and file_md5(fs_, path) + '.part' == part['name'])
+
+
+def join_parts(fs_: FS, manifest: dict, parts_dir: str, path: str):
+    """Assemble the file from parts listed in manifest, and verify its hash."""
+    file_hash = hashlib.md5()
+    with fs_.openbin(path, 'w') as f:
+        for part in manifest['parts']:
+            chunk = fs_.readbytes(part_path(parts_dir, part))
+            file_hash.update(chunk)
+            f.write(chunk)
+
+    if file_hash.hexdigest() != manifest['hash']:
+        fs_.remove(path)
+        raise ValueError(f'File `{path}` assembled from parts does not match hash of the manifest.')
+
+
+def remove_unlisted_parts(fs_: FS, parts_dir: str, manifest: dict):
+    if not fs_.exists(parts_dir):
+        return
+    names = {part['name'] for part in manifest['parts']}
+    for name in fs_.listdir(parts_dir):
+        if name not in names:
+            fs_.remove(fs.path.join(parts_dir, name))
+
+
+def copy_files_parallel(open_src_fs: Callable[[], FS], open_dst_fs: Callable[[], FS],
+                        paths: list[str], workers=4):
+    """
+    Copy files using several threads.
+    Each thread opens its own pair of fs instances, since network fs (e.g. Google Drive) serializes calls
+     via a lock held by the instance, or is not thread-safe at all.
+    """
+    local = threading.local()
+    fs_pairs = []
+
+    def copy(path):
+        if not hasattr(local, 'fs_pair'):
+            local.fs_pair = open_src_fs(), open_dst_fs()
+            fs_pairs.append(local.fs_pair)
+        src_fs, dst_fs = local.fs_pair
+        copy_file(src_fs, path, dst_fs, path, True)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # consume results to re-raise errors of workers
+            list(executor.map(copy, paths))
+    finally:
+        for src_fs, dst_fs in fs_pairs:
+            src_fs.close()
+            dst_fs.close()
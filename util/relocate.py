@@ -0,0 +1,162 @@
+from collections import defaultdict
+from typing import NamedTuple
+
+import fs.errors
+import fs.path
+from fs.base import FS
+from fs.info import Info
+from fs.walk import Walker
+from fs.wrapfs import WrapFS
+
+
+class Relocation(NamedTuple):
+    """A server-side (or local) operation that places already present content at a new path of destination fs."""
+    op: str  # 'move' or 'copy'
+    src_path: str  # existing path within destination fs
+    dst_path: str  # new path within destination fs
+    modified: float | None  # mtime of the source file, to be set on the new path
+
+
+class ListingCacheFS(WrapFS):
+    """
+    Remembers directory listings, so the fs can be walked twice (planning relocations, then mirroring)
+     for the cost of one walk, which matters for network fs (e.g. a Drive API call per dir).
+    Listings of dirs changed via this wrapper by relocations (move, copy, setinfo, makedir) are forgotten.
+    """
+
+    def __init__(self, wrap_fs: FS):
+        super().__init__(wrap_fs)
+        self._listings = {}  # (dir path, namespaces) -> list of Info
+
+    def scandir(self, path, namespaces=None, page=None):
+        if page is not None:
+            return super().scandir(path, namespaces, page)
+        key = (fs.path.abspath(fs.path.normpath(path)), tuple(sorted(namespaces or ())))
+        if key not in self._listings:
+            self._listings[key] = list(super().scandir(path, namespaces))
+        return iter(self._listings[key])
+
+    def forget(self, path: str):
+        """Forget listing of the dir containing path"""
+        dir_path = fs.path.abspath(fs.path.dirname(fs.path.normpath(path)))
+        for key in [key for key in self._listings if key[0] == dir_path]:
+            del self._listings[key]
+
+    def makedir(self, path, permissions=None, recreate=False):
+        self.forget(path)
+        return super().makedir(path, permissions, recreate)
+
+    def move(self, src_path, dst_path, overwrite=False, preserve_time=False):
+        self.forget(src_path)
+        self.forget(dst_path)
+        super().move(src_path, dst_path, overwrite, preserve_time)
+
+    def copy(self, src_path, dst_path, overwrite=False, preserve_time=False):
+        self.forget(dst_path)
+        super().copy(src_path, dst_path, overwrite, preserve_time)
+
+    def setinfo(self, path, info):
+        self.forget(path)
+        super().setinfo(path, info)
+
+
+def file_md5(fs_: FS, path: str) -> str:
+    """
+    Get md5 hex digest of a file, preferring the hash reported by the fs itself
+     (e.g. Google Drive keeps `md5Checksum` for every file), so the file is not read if possible.
+    """
+    info = fs_.getinfo(path, namespaces=['hashes'])
+    hashes = info.raw.get('hashes') or {}
+    return (hashes.get('MD5') or fs_.hash(path, 'md5')).lower()
+
+
+def list_file_infos(fs_: FS, walker: Walker = None) -> dict[str, Info]:
+    walker = walker or Walker()
+    return {
+        path: info
+        for path, info in walker.info(fs_, namespaces=['details'])
+        if info.is_file
+    }
+
+
+def plan_relocations(src_fs: FS, dst_fs: FS, walker: Walker = None) -> list[Relocation]:
+    """
+    Find files that are going to be added to dst_fs by mirroring while the same content is already there.
+    Deleted and added paths are matched by size first, then by md5 hash (only files of matching sizes are hashed).
+    A deleted file with matching content is moved to the new path, any other file with matching content is copied.
+    :param src_fs: a PyfileSystem fs to mirror from
+    :param dst_fs: a PyfileSystem fs to mirror to
+    :param walker: optional Walker (with filters) limiting the scope of mirroring
+    :return: list of operations to be applied to dst_fs in order
+    """
+    src_files = list_file_infos(src_fs, walker)
+    dst_files = list_file_infos(dst_fs, walker)
+
+    added = sorted(p for p in src_files if p not in dst_files)
+    # empty files are cheap to create as is
+    sizes = {src_files[p].size for p in added if src_files[p].size}
+    if not sizes:
+        return []
+
+    removed_by_size = defaultdict(list)
+    kept_by_size = defaultdict(list)
+    for path, info in sorted(dst_files.items()):
+        if info.size in sizes:
+            (kept_by_size if path in src_files else removed_by_size)[info.size].append(path)
+
+    dst_hashes = {}
+
+    def dst_hash(path):
+        if path not in dst_hashes:
+            dst_hashes[path] = file_md5(dst_fs, path)
+        return dst_hashes[path]
+
+    placed = {}  # hash -> path within dst_fs already having this content
+    moved = set()
+    relocations = []
+    for path in added:
+        info = src_files[path]
+        if not info.size or not (removed_by_size[info.size] or kept_by_size[info.size]):
+            continue
+        content_hash = file_md5(src_fs, path)
+        modified = info.raw['details'].get('modified')
+
+        # 1. prefer moving a file that would be deleted anyway
+        old_path = next((p for p in removed_by_size[info.size]
+                         if p not in moved and dst_hash(p) == content_hash), None)
+        if old_path:
+            relocations.append(Relocation('move', old_path, path, modified))
+            moved.add(old_path)
+            placed.setdefault(content_hash, path)
+            continue
+
+        # 2. otherwise, copy a file having the same content
+        old_path = placed.get(content_hash) or next(
+            (p for p in kept_by_size[info.size] if dst_hash(p) == content_hash), None)
+        if old_path:
+            relocations.append(Relocation('copy', old_path, path, modified))
+            placed.setdefault(content_hash, path)
+
+    return relocations
+
+
+def apply_relocations(dst_fs: FS, relocations: list[Relocation]) -> int:
+    """
+    Perform moves/copies within dst_fs. Failed operations are skipped: mirroring will transfer those files as usual.
+    :return: number of operations succeeded
+    """
+    count_ok = 0
+    for r in relocations:
+        try:
+            dst_fs.makedirs(fs.path.dirname(r.dst_path), recreate=True)
+            if r.op == 'move':
+                dst_fs.move(r.src_path, r.dst_path)
+            else:
+                dst_fs.copy(r.src_path, r.dst_path, preserve_time=True)
+            if r.modified is not None:
+                # make the file look up-to-date for mirroring
+                dst_fs.setinfo(r.dst_path, {'details': {'modified': r.modified}})
+            count_ok += 1
+        except fs.errors.FSError as e:
+            print(end=f' (cannot {r.op} {r.src_path} -> {r.dst_path}: {e!r})')
+    return count_ok